@@ -1,10 +1,10 @@
+import _thread
+import collections
 import datetime as dt
-import importlib.util
+import functools
 import inspect
 import itertools
-import json
 import os
-import pathlib
 import sys
 import types
 import typing
@@ -13,11 +13,11 @@ from typing import (
     Callable,
     Dict,
     Generic,
-    Iterable,
-    Iterator,
     List,
     Optional,
+    Sequence,
     Set,
+    TextIO,
     Tuple,
     Type,
     TypeVar,
@@ -29,10 +29,13 @@ T = TypeVar("T")
 O = TypeVar("O", Any, None)
 StringInterpreters = Dict[Type[T], Callable[[str], T]]
 
+# sentinel for dict lookups where None (or False) is a legitimate value
+_MISSING = object()
+
 
 def call(
     c: Callable[..., T],
-    args: Optional[List[str]] = None,
+    args: Optional[Sequence[str]] = None,
     string_interpreters: Optional[StringInterpreters] = None,
 ) -> T:
     """
@@ -44,29 +47,26 @@ def call(
     interpreters = (
         string_interpreters
         if string_interpreters is not None
-        else default_string_interpreters()
+        else DEFAULT_STRING_INTERPRETERS
     )
-    annotated = annotate_callable(c, interpreters, [])
-    provided_inputs = assemble_input_sources(argv)
+    annotated = cached_annotate_callable(c, interpreters)
+    arguments = interpret_arguments(argv)
 
-    if provided_inputs.args.help:
+    # check the arguments before doing any work to load config files or environment
+    if arguments.help:
         print_usage(annotated, header=True)
         sys.exit(0)
 
-    needed_inputs = all_needed_inputs(annotated)
-
-    unknown = invalid_args(provided_inputs.args.keyword.keys(), needed_inputs)
+    unknown = arguments.keyword.keys() - annotated.plan.valid_names
     if unknown:
-        print(f"Unknown arguments: {unknown}")
-        print_usage(annotated)
-        sys.exit(1)
+        fail(f"Unknown arguments: {unknown}", annotated)
 
+    needed_inputs = all_needed_inputs(annotated)
+    provided_inputs = assemble_input_sources(arguments, needed_inputs)
     resolved_inputs, missing_inputs = resolve_inputs(needed_inputs, provided_inputs)
 
     if missing_inputs:
-        print(f"Missing arguments: {missing_inputs}")
-        print_usage(annotated)
-        sys.exit(1)
+        fail(f"Missing arguments: {missing_inputs}", annotated)
 
     return annotated(resolved_inputs)
 
@@ -77,14 +77,10 @@ def call(
 
 
 def default_string_interpreters() -> StringInterpreters:
-    return {
-        int: int,
-        float: float,
-        str: str,
-        bool: interpret_bool,
-        dt.datetime: interpret_datetime,
-        dt.date: interpret_date,
-    }
+    """
+    A fresh copy of the default interpreters, safe to modify and pass to `call`
+    """
+    return dict(DEFAULT_STRING_INTERPRETERS)
 
 
 class InterpretationError(ValueError):
@@ -96,26 +92,42 @@ class InterpretationError(ValueError):
         return f"Could not interpret '{self.s}' as {self.t}"
 
 
+BOOL_STRINGS = {
+    "t": True,
+    "true": True,
+    "yes": True,
+    "y": True,
+    "f": False,
+    "false": False,
+    "no": False,
+    "n": False,
+}
+
+
 def interpret_bool(s: str) -> bool:
     """
     Slightly more intuitive bool iterpretation
 
     Raw python's `bool("false")==True` since it is a non-empty string
     """
-    if s.lower() in {"t", "true", "yes", "y"}:
-        return True
-    elif s.lower() in {"f", "false", "no", "n"}:
-        return False
-    else:
+    value = BOOL_STRINGS.get(s.lower(), _MISSING)
+    if value is _MISSING:
         raise InterpretationError(s, bool)
+    return value
+
+
+# resolved once rather than on every call. These are None on python 3.6, where the
+# `fromisoformat` constructors don't exist
+DATETIME_FROMISOFORMAT = getattr(dt.datetime, "fromisoformat", None)
+DATE_FROMISOFORMAT = getattr(dt.date, "fromisoformat", None)
 
 
 def interpret_datetime(s: str) -> dt.datetime:
     """
     Date and time in isoformat
     """
-    if hasattr(dt.datetime, "fromisoformat"):
-        return dt.datetime.fromisoformat(s)
+    if DATETIME_FROMISOFORMAT is not None:
+        return DATETIME_FROMISOFORMAT(s)
     else:
         # for python 3.6 where `fromisoformat` doesn't exist
         import isodate  # type: ignore
@@ -127,20 +139,37 @@ def interpret_date(s: str) -> dt.date:
     """
     Dates in YYYY-MM-DD format
     """
-    return dt.date(*[int(i) for i in s.split("-")])
+    # `fromisoformat` is faster, but newer pythons also accept other iso formats (like
+    # 20210105), so it is only tried on strings that are already YYYY-MM-DD shaped.
+    # Everything else gets the same parsing on every python version.
+    if DATE_FROMISOFORMAT is not None and len(s) == 10 and s[4] == s[7] == "-":
+        try:
+            return DATE_FROMISOFORMAT(s)
+        except ValueError:
+            pass
+    try:
+        return dt.date(*[int(i) for i in s.split("-")])
+    except (ValueError, TypeError):
+        raise InterpretationError(s, dt.date)
+
+
+DEFAULT_STRING_INTERPRETERS: StringInterpreters = {
+    int: int,
+    float: float,
+    str: str,
+    bool: interpret_bool,
+    dt.datetime: interpret_datetime,
+    dt.date: interpret_date,
+}
 
 
 def interpret_string_as_type(
     s: str, t: Type[T], type_converters: StringInterpreters
 ) -> T:
-    try:
-        return (
-            type_converters[unwrap_optional(t)](s)
-            if is_optional(t)
-            else type_converters[t](s)
-        )
-    except KeyError:
+    converter = type_converters.get(unwrap_optional(t) if is_optional(t) else t)
+    if converter is None:
         raise InterpretationError(s, t)
+    return converter(s)
 
 
 ################################################################################
@@ -152,6 +181,8 @@ def interpret_string_as_type(
 
 
 class Arguments:
+    __slots__ = ("positional", "keyword", "help")
+
     def __init__(
         self, positional: List[str], keyword: Dict[str, str], help: bool = False
     ):
@@ -161,72 +192,107 @@ class Arguments:
 
 
 class ConfigFiles:
-    def __init__(self, configs: List[Dict[str, str]]):
-        self.configs = configs
+    """
+    Values from json config files, which are read the first time a value is looked up
+
+    Later config files override earlier ones.
+    """
+
+    __slots__ = ("filenames", "fingerprints", "_merged")
+
+    def __init__(self, filenames: List[str], fingerprints: List[Tuple[int, int]]):
+        self.filenames = filenames
+        # the (mtime, size) of each file when it was found, see `load_config_files`
+        self.fingerprints = fingerprints
+        self._merged: Optional[Dict[str, str]] = None
+
+    @property
+    def merged(self) -> Dict[str, str]:
+        if self._merged is None:
+            merged: Dict[str, str] = {}
+            for config in read_config_files(self.filenames, self.fingerprints):
+                merged.update(config)
+            self._merged = merged
+        return self._merged
 
     def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
-        for config in self.configs:
-            if key in config:
-                return config[key]
-        return default
+        return self.merged.get(key, default)
 
 
 Annotated = Union["AnnotatedParameter", "AnnotatedCallable"]
 
 
 class AnnotatedCallable(Generic[T]):
+    __slots__ = ("callable", "name", "needed_inputs", "_plan")
+
     def __init__(
         self, callable: Callable[[...], T], name: str, needed_inputs: List[Annotated]
     ):
         self.callable = callable
         self.name = name
         self.needed_inputs = needed_inputs
+        self._plan: Optional[BuildPlan] = None
+
+    @property
+    def plan(self) -> "BuildPlan":
+        if self._plan is None:
+            self._plan = compile_plan(self)
+        return self._plan
 
     def __call__(self, inputs: Dict[str, str]):
-        def collect(needed: Annotated):
-            if isinstance(needed, AnnotatedParameter):
-                value = inputs[needed.prefixed_name]
-                if value is None:
-                    if is_optional(needed.t):
-                        return None
-                    raise ValueError(
-                        f"Somehow got None for non optional parameter {needed}"
-                    )
-                return needed(value)
-            return needed(inputs)
-
-        collected_inputs = {
-            needed.name: collect(needed) for needed in self.needed_inputs
-        }
-        return self.callable(**collected_inputs)
+        def collect(needed: AnnotatedParameter):
+            value = inputs[needed.prefixed_name]
+            if value is None:
+                if needed.optional:
+                    return None
+                raise ValueError(
+                    f"Somehow got None for non optional parameter {needed}"
+                )
+            return needed(value)
+
+        plan = self.plan
+        values = [collect(leaf) for leaf in plan.leaves]
+        for c, names, slots in plan.steps:
+            values.append(c(**{name: values[i] for name, i in zip(names, slots)}))
+        return values[-1]
 
     def __str__(self) -> str:
         return f"<callable: {self.name} {[str(i) for i in self.needed_inputs]}>"
 
 
 class AnnotatedParameter(Generic[T]):
+    __slots__ = (
+        "parameter",
+        "from_string",
+        "prefix",
+        "name",
+        "prefixed_name",
+        "env_name",
+        "t",
+        "optional",
+        "default",
+        "description",
+    )
+
     def __init__(
-        self, parameter: inspect.Parameter, from_string: Callable[[str], T], prefix
+        self,
+        parameter: inspect.Parameter,
+        from_string: Callable[[str], T],
+        prefix: Sequence[str],
     ):
         self.parameter = parameter
         self.from_string = from_string
-        self.prefix = prefix
-
-    @property
-    def name(self):
-        return self.parameter.name
-
-    @property
-    def prefixed_name(self):
-        return ".".join(self.prefix + [self.name])
-
-    @property
-    def t(self):
-        return self.parameter.annotation
-
-    @property
-    def default(self):
-        return self.parameter.default
+        self.prefix = tuple(prefix)
+        self.name = sys.intern(parameter.name)
+        # interned so lookups in the argument, config, and resolved input dicts can
+        # short circuit on identity
+        self.prefixed_name = sys.intern(".".join(self.prefix + (self.name,)))
+        # the environment variable that can provide this parameter
+        self.env_name = self.prefixed_name.upper()
+        self.t = parameter.annotation
+        self.optional = is_optional(self.t)
+        self.default = parameter.default
+        self.description = describe_parameter(self)
 
     def __call__(self, input: Optional[str]) -> T:
         return self.from_string(input)
@@ -235,17 +301,63 @@ class AnnotatedParameter(Generic[T]):
         return f"<parameter: {self.name}: {self.t}>"
 
 
+class BuildPlan:
+    """
+    A flattened form of an AnnotatedCallable tree
+
+    Values are kept in a list of slots. The first `len(leaves)` slots hold the
+    interpreted values of `leaves`, and each step `(callable, names, slots)` calls
+    `callable` with the values in `slots` as keyword arguments `names` and appends the
+    result as the next slot. Steps are in post-order, so the last one builds the root.
+    """
+
+    __slots__ = ("leaves", "steps", "valid_names")
+
+    def __init__(
+        self,
+        leaves: List[AnnotatedParameter],
+        steps: List[Tuple[Callable, Tuple[str, ...], Tuple[int, ...]]],
+    ):
+        self.leaves = leaves
+        self.steps = steps
+        self.valid_names = frozenset(valid_args(leaves))
+
+
 class InputSources:
-    def __init__(self, args: Arguments, config_files: ConfigFiles):
+    __slots__ = ("args", "config_files", "environment")
+
+    def __init__(
+        self,
+        args: Arguments,
+        config_files: ConfigFiles,
+        environment: Dict[str, str],
+    ):
         self.args = args
         self.config_files = config_files
-
-    def get(self, key: str, default: Optional[T] = None) -> Union[str, T, None]:
-        env_value = os.environ.get(key.upper(), default)
-        return self.args.keyword.get(key, self.config_files.get(key, env_value))
-
-    def get_value(self, value: AnnotatedParameter) -> Union[str, T, None]:
-        return self.get(value.prefixed_name, value.default)
+        # values of environment variables, keyed by the (not upper cased) input name
+        self.environment = environment
+
+    def resolve_all(self, needed_inputs: List[AnnotatedParameter]) -> Dict[str, Any]:
+        """
+        Look up all needed inputs in one pass
+
+        Each input comes from the first of the command line arguments, config files, and
+        environment that has it, falling back to the input's default. Config files are
+        loaded lazily, so are only read if they are needed.
+        """
+        keyword = self.args.keyword
+        config_files = self.config_files
+        environment = self.environment
+        resolved = {}
+        for v in needed_inputs:
+            name = v.prefixed_name
+            value = keyword.get(name, _MISSING)
+            if value is _MISSING:
+                value = config_files.get(name, _MISSING)
+                if value is _MISSING:
+                    value = environment.get(name, v.default)
+            resolved[name] = value
+        return resolved
 
 
 ################################################################################
@@ -253,41 +365,160 @@ class InputSources:
 ################################################################################
 
 
-def assemble_input_sources(args: List[str]) -> InputSources:
-    args_object = interpret_arguments(args)
-    return InputSources(args_object, load_config_files(args_object.positional))
+def assemble_input_sources(
+    args: Arguments, needed_inputs: List[AnnotatedParameter]
+) -> InputSources:
+    return InputSources(
+        args,
+        load_config_files(args.positional),
+        snapshot_environment(needed_inputs),
+    )
+
+
+def snapshot_environment(needed_inputs: List[AnnotatedParameter]) -> Dict[str, str]:
+    """
+    Look up the environment variables for all needed inputs in one pass
+
+    Each input `some.name` can be provided by the environment variable `SOME.NAME`.
+    """
+    environ = os.environ
+    snapshot = {}
+    for v in needed_inputs:
+        if v.env_name in environ:
+            snapshot[v.prefixed_name] = environ[v.env_name]
+    return snapshot
+
 
+HELP_FLAGS = frozenset({"-h", "--help"})
 
-def interpret_arguments(args: Optional[List[str]] = None) -> Arguments:
+
+def interpret_arguments(args: Optional[Sequence[str]] = None) -> Arguments:
     if args is None:
         args = sys.argv
-    i = 1
     keyword = {}
     positional = []
-    while i < len(args):
-        arg = args[i]
-        key = arg[2:]
-        if arg in {"-h", "--help"}:
+    # skip the program name without copying the rest of args
+    it = itertools.islice(args, 1, None)
+    for arg in it:
+        if arg in HELP_FLAGS:
             return Arguments([], {}, True)
-        if arg[:2] == "--":
-            if len(args) < i + 2:
-                raise ValueError(f"Missing value for argument: {key}")
-            keyword[key] = args[i + 1]
-            i += 2
+        if arg.startswith("--"):
+            value = next(it, _MISSING)
+            if value is _MISSING:
+                raise ValueError(f"Missing value for argument: {arg[2:]}")
+            # interned to match the interned prefixed names they are looked up by
+            keyword[sys.intern(arg[2:])] = value
         else:
             positional.append(arg)
-            i += 1
     return Arguments(positional, keyword, not (keyword or positional))
 
 
+# Parsed config files can be kept between calls, for programs that run `call` many times
+# in one process. This is off by default, since a command line run reads its config files
+# once. Set CONFIG_FILE_CACHE_BYTES to the total size of config files to keep; least
+# recently used files are dropped past it. A cached file is re-parsed when its
+# (mtime, size) changes, so a rewrite at the same size within the filesystem's timestamp
+# resolution can be missed. Call `clear_cli_cache` after writing such a file.
+CONFIG_FILE_CACHE_BYTES = 0
+
+# Parsed config files by absolute path, along with the (mtime, size) they were parsed at
+_config_file_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, str]]] = {}
+# the lock threading.Lock() returns, without the cost of importing threading
+_config_file_cache_lock = _thread.allocate_lock()
+
+
+def cached_config_file(
+    path: str, fingerprint: Tuple[int, int]
+) -> Optional[Dict[str, str]]:
+    with _config_file_cache_lock:
+        # popped and reinserted so the dict stays in least recently used order
+        cached = _config_file_cache.pop(path, None)
+        if cached is None or cached[0] != fingerprint:
+            return None
+        _config_file_cache[path] = cached
+        return cached[1]
+
+
+def cache_config_file(
+    path: str, fingerprint: Tuple[int, int], config: Dict[str, str]
+) -> None:
+    size = fingerprint[1]
+    with _config_file_cache_lock:
+        _config_file_cache.pop(path, None)
+        total = sum(cached[0][1] for cached in _config_file_cache.values())
+        while _config_file_cache and total + size > CONFIG_FILE_CACHE_BYTES:
+            oldest = next(iter(_config_file_cache))
+            total -= _config_file_cache.pop(oldest)[0][1]
+        if size <= CONFIG_FILE_CACHE_BYTES:
+            _config_file_cache[path] = (fingerprint, config)
+
+
 def load_config_files(filenames: List[str]) -> ConfigFiles:
-    # reverse the order so that later config files override earlier ones
-    def load(name):
-        if not pathlib.Path(name).exists():
+    """
+    Config files to look up values in
+
+    The files are stat'ed up front, so a mistyped name is always reported, but are not
+    read until a value is needed from them, so they are never parsed if everything is
+    provided on the command line. The stat is kept to check the config file cache against
+    later, so each file is only stat'ed once.
+    """
+    fingerprints = []
+    for name in filenames:
+        try:
+            stat = os.stat(name)
+        except FileNotFoundError:
             raise ValueError(f"Could not find config file {name}")
-        return json.load(open(name))
+        fingerprints.append((stat.st_mtime_ns, stat.st_size))
+    return ConfigFiles(filenames, fingerprints)
+
+
+def read_config_files(
+    filenames: List[str], fingerprints: List[Tuple[int, int]]
+) -> List[Dict[str, str]]:
+    if not filenames:
+        return []
+
+    # imported here so programs that never use config files don't pay for them
+    import json
+
+    def load(name, fingerprint):
+        path = os.path.abspath(name)
+        if CONFIG_FILE_CACHE_BYTES:
+            cached = cached_config_file(path, fingerprint)
+            if cached is not None:
+                return cached
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise ValueError(f"Could not find config file {name}")
+        parsed = json.loads(data)
+        if not isinstance(parsed, dict):
+            raise ValueError(f"Config file {name} must contain a JSON object")
+        config = flatten_config(parsed)
+        if CONFIG_FILE_CACHE_BYTES:
+            cache_config_file(path, fingerprint, config)
+        return config
 
-    return ConfigFiles([load(name) for name in filenames[::-1]])
+    return [load(name, f) for name, f in zip(filenames, fingerprints)]
+
+
+def flatten_config(config: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    """
+    Flatten nested objects in a config into dotted keys
+
+    `{"f": {"a": 1}}` becomes `{"f": {"a": 1}, "f.a": 1}`, matching the names used for
+    nested inputs on the command line, so configs can be written either way. Objects are
+    kept under their own key too, for parameters whose interpreter takes the object.
+    """
+    flat = {}
+    for key, value in config.items():
+        # interned to match the interned prefixed names they are looked up by
+        name = sys.intern(f"{prefix}{key}")
+        flat[name] = value
+        if isinstance(value, dict):
+            flat.update(flatten_config(value, f"{name}."))
+    return flat
 
 
 NOT_SPECIFIED = inspect._empty
@@ -297,19 +528,11 @@ def resolve_inputs(
     needed_inputs: List[AnnotatedParameter], provided_inputs: InputSources
 ) -> Tuple[Dict[str, Optional[str]], Set[str]]:
     missing = set()
-
-    def resolve(v):
-        s = provided_inputs.get_value(v)
-        if s is None:
-            if is_optional(v.t):
-                return None
-            else:
-                missing.add(v.prefixed_name)
-        if s == NOT_SPECIFIED:
+    collected = provided_inputs.resolve_all(needed_inputs)
+    for v in needed_inputs:
+        s = collected[v.prefixed_name]
+        if s is NOT_SPECIFIED or (s is None and not v.optional):
             missing.add(v.prefixed_name)
-        return s
-
-    collected = {value.prefixed_name: resolve(value) for value in needed_inputs}
 
     return collected, missing
 
@@ -319,39 +542,53 @@ def resolve_inputs(
 ################################################################################
 
 
-def check_usage(provided_inputs, needed_inputs) -> None:
-    check_help(provided_inputs, needed_inputs)
-    check_invalid_args(provided_inputs, needed_inputs)
-
-
 def valid_args(values: List[AnnotatedParameter]) -> Set[str]:
     return {v.prefixed_name for v in values}
 
 
 def invalid_args(args, allowed_args):
-    return set(args) - valid_args(allowed_args)
+    valid = valid_args(allowed_args)
+    return {a for a in args if a not in valid}
+
+
+def fail(message: str, annotated: AnnotatedCallable) -> typing.NoReturn:
+    """
+    Report a usage error on stderr and exit
+    """
+    print(message, file=sys.stderr)
+    print_usage(annotated, file=sys.stderr)
+    sys.exit(1)
 
 
-def print_usage(annotated: AnnotatedCallable, header: bool = False) -> None:
+def print_usage(
+    annotated: AnnotatedCallable, header: bool = False, file: Optional[TextIO] = None
+) -> None:
     needed_inputs = all_needed_inputs(annotated)
+    lines = []
     if header:
-        print(f"{annotated.name}\n")
+        lines.append(f"{annotated.name}\n")
         doc = inspect.getdoc(annotated.callable)
         if doc:
-            print(f"{doc}\n")
-    print(f"Usage: {sys.argv[0]} [config_file] [--key: value]")
-    print("\n".join(describe_needed(needed_inputs)))
+            lines.append(f"{doc}\n")
+    lines.append(f"Usage: {sys.argv[0]} [config_file] [--key: value]")
+    lines.extend(describe_needed(needed_inputs))
+    # a single write rather than a print per section
+    print("\n".join(lines), file=file)
 
 
 def describe_needed(needed_inputs: List[AnnotatedParameter]) -> List[str]:
-    def desc(v):
-        base = f" --{v.prefixed_name}: {type_to_string(v.t)}"
-        if v.default != NOT_SPECIFIED:
-            default = f'"{v.default}"' if isinstance(v.default, str) else v.default
-            return f"{base} (default: {default})"
-        return base
+    return [v.description for v in needed_inputs]
+
 
-    return [desc(v) for v in needed_inputs]
+def describe_parameter(v: AnnotatedParameter) -> str:
+    """
+    The usage line for a parameter, computed once when it is annotated
+    """
+    base = f" --{v.prefixed_name}: {type_to_string(v.t)}"
+    if v.default != NOT_SPECIFIED:
+        default = f'"{v.default}"' if isinstance(v.default, str) else v.default
+        return f"{base} (default: {default})"
+    return base
 
 
 ################################################################################
@@ -360,73 +597,260 @@ def describe_needed(needed_inputs: List[AnnotatedParameter]) -> List[str]:
 
 
 def all_needed_inputs(c: AnnotatedCallable) -> List[AnnotatedParameter]:
-    def inner():
-        for needed in c.needed_inputs:
-            if isinstance(needed, AnnotatedParameter):
-                yield needed
-            else:
-                yield from all_needed_inputs(needed)
+    return c.plan.leaves
+
+
+def compile_plan(c: AnnotatedCallable) -> BuildPlan:
+    # Both passes walk the tree depth first with explicit stacks of iterators rather than
+    # recursing. The first collects the leaves, which take the first slots.
+    leaves: List[AnnotatedParameter] = []
+    inputs_stack = [iter(c.needed_inputs)]
+    while inputs_stack:
+        needed = next(inputs_stack[-1], None)
+        if needed is None:
+            inputs_stack.pop()
+        elif type(needed) is AnnotatedParameter:
+            leaves.append(needed)
+        else:
+            inputs_stack.append(iter(needed.needed_inputs))
+
+    # The second emits a step for each callable once all of its inputs have slots
+    steps: List[Tuple[Callable, Tuple[str, ...], Tuple[int, ...]]] = []
+    next_leaf = 0
+    stack = [(c, iter(c.needed_inputs), [])]
+    while stack:
+        node, inputs, slots = stack[-1]
+        needed = next(inputs, None)
+        if needed is None:
+            stack.pop()
+            names = tuple(n.name for n in node.needed_inputs)
+            steps.append((node.callable, names, tuple(slots)))
+            if stack:
+                stack[-1][2].append(len(leaves) + len(steps) - 1)
+        elif type(needed) is AnnotatedParameter:
+            slots.append(next_leaf)
+            next_leaf += 1
+        else:
+            stack.append((needed, iter(needed.needed_inputs), []))
+
+    return BuildPlan(leaves, steps)
+
+
+def inspect_parameters(t: Type[T]) -> Tuple[inspect.Parameter, ...]:
+    try:
+        hash(t)
+    except TypeError:
+        # unhashable callables can't be cached
+        return uncached_inspect_parameters(t)
+    # outside the try, so a TypeError from the lookup itself isn't retried uncached
+    return cached_inspect_parameters(t)
+
+
+def uncached_inspect_parameters(t: Type[T]) -> Tuple[inspect.Parameter, ...]:
+    fast = fast_parameters(t)
+    if fast is not None:
+        return fast
+    return tuple(inspect.signature(t).parameters.values())
+
+
+# Bounded since the cache keeps the callables it has seen alive, including bound methods
+# and their instances
+MAX_CACHED_SIGNATURES = 256
+cached_inspect_parameters = functools.lru_cache(maxsize=MAX_CACHED_SIGNATURES)(
+    uncached_inspect_parameters
+)
 
-    return list(inner())
 
+def fast_parameters(t: Type[T]) -> Optional[Tuple[inspect.Parameter, ...]]:
+    """
+    Read the parameters of a plain function or class straight from its code object
 
-def inspect_parameters(t: Type[T]) -> Iterable[inspect.Parameter]:
-    return inspect.signature(t).parameters.values()
+    `inspect.signature` is slow since it has to handle every kind of callable. For the
+    common cases (functions and classes with an ordinary `__init__`, which includes attrs
+    classes and dataclasses) we can build the same parameters directly. Returns None for
+    anything else so the caller can fall back to `inspect.signature`.
+    """
+    if inspect.isclass(t):
+        if type(t) is not type or t.__new__ is not object.__new__:
+            return None
+        f = t.__init__
+        skip = 1
+    else:
+        f = t
+        skip = 0
+    if not inspect.isfunction(f) or hasattr(f, "__wrapped__"):
+        return None
+    if hasattr(t, "__signature__") or hasattr(f, "__signature__"):
+        return None
+    code = f.__code__
+    if code.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS):
+        return None
+    if getattr(code, "co_posonlyargcount", 0):
+        return None
+
+    positional = code.co_varnames[skip : code.co_argcount]
+    keyword_only = code.co_varnames[
+        code.co_argcount : code.co_argcount + code.co_kwonlyargcount
+    ]
+    defaults = f.__defaults__ or ()
+    kwdefaults = f.__kwdefaults__ or {}
+    annotations = f.__annotations__
+    first_default = len(positional) - len(defaults)
+
+    def parameter(name, kind, default):
+        return inspect.Parameter(
+            name,
+            kind,
+            default=default,
+            annotation=annotations.get(name, NOT_SPECIFIED),
+        )
+
+    return tuple(
+        parameter(
+            name,
+            inspect.Parameter.POSITIONAL_OR_KEYWORD,
+            defaults[i - first_default] if i >= first_default else NOT_SPECIFIED,
+        )
+        for i, name in enumerate(positional)
+    ) + tuple(
+        parameter(
+            name,
+            inspect.Parameter.KEYWORD_ONLY,
+            kwdefaults.get(name, NOT_SPECIFIED),
+        )
+        for name in keyword_only
+    )
+
+
+NONE_TYPE = type(None)
+# `X | None` style unions (python 3.10+) are not `typing.Union`s
+UNION_TYPE = getattr(types, "UnionType", None)
 
 
 def is_optional(t: Type[T]) -> bool:
-    return Union[t, None] == t
+    # Checked in order of how common they are. This is cheaper than memoizing, since
+    # typing's Union types recompute their hash on every cache lookup.
+    if type(t) is type:
+        return False
+    if UNION_TYPE is not None and type(t) is UNION_TYPE:
+        return NONE_TYPE in t.__args__  # type: ignore
+    return getattr(t, "__origin__", None) is Union and NONE_TYPE in t.__args__  # type: ignore
 
 
 def unwrap_optional(t: Optional[Type[T]]) -> Type[T]:
-    if hasattr(typing, "get_args"):
-        args = typing.get_args(t)
-        if len(args) == 0:
-            return t
-        else:
-            return args[0]
-    # fallback for python < 3.8. May be brittle since it depends on an `_`'d interface
-    # this should use typing.get_args, but that is not available until python 3.8
-    if type(t) != typing._GenericAlias:
-        return t
-    for s in t.__args__:  # type: ignore
-        if s != type(None):
-            return s
+    # Not memoized for the same reason as is_optional. __args__ is read directly
+    # rather than through typing.get_args, which is not available before python 3.8
+    if type(t) is type:
+        return t  # type: ignore
+    args = getattr(t, "__args__", None)
+    if not args:
+        return t  # type: ignore
+    if args[0] is not NONE_TYPE:
+        return args[0]
+    return args[1] if len(args) > 1 else t
 
 
 def type_to_string(t: Type[O]) -> str:
     if is_optional(t):
-        return f"Optional[{unwrap_optional(t).__name__}]"
-    return t.__name__
+        return f"Optional[{type_to_string(unwrap_optional(t))}]"
+    # typing aliases used as interpreter keys may not have a __name__
+    return getattr(t, "__name__", str(t))
+
 
+def annotate_leaf(
+    parameter: inspect.Parameter,
+    interpreter: StringInterpreters,
+    prefix: Sequence[str],
+) -> Optional[AnnotatedParameter]:
+    """
+    Annotate a parameter if it is a "basic" value we know how to interpret
 
-def annotate_parameter(
-    parameter: inspect.Parameter, interpreter: StringInterpreters, prefix: List[str]
-) -> Union[AnnotatedParameter, AnnotatedCallable]:
+    Returns None for composite parameters
+    """
     if parameter.annotation == NOT_SPECIFIED:
         raise Exception(f"Missing type annotation for {parameter}")
     t = unwrap_optional(parameter.annotation)
     if t in interpreter:
-        # We have found a "basic" value we know how to interpret
         return AnnotatedParameter(parameter, from_string=interpreter[t], prefix=prefix)
-
-    # This is some kind of composite
-    prefix = prefix + [parameter.name]
-    return annotate_callable(parameter.annotation, interpreter, prefix, parameter.name)
+    return None
 
 
 def annotate_callable(
     callable: Callable[[...], T],
     interpreter: StringInterpreters,
-    prefix: List[str],
+    prefix: Sequence[str],
     name: Optional[str] = None,
 ) -> AnnotatedCallable[T]:
-    needed = [
-        annotate_parameter(p, interpreter, prefix) for p in inspect_parameters(callable)
-    ]
-    return AnnotatedCallable(
-        callable, name if name is not None else callable.__name__, needed
-    )
+    if name is None:
+        # instances with a __call__ method don't have a __name__
+        name = getattr(callable, "__name__", type(callable).__name__)
+    root = AnnotatedCallable(callable, name, [])
+    # Walk composites breadth first with an explicit queue rather than recursing
+    # prefixes are tuples so extending one for a child doesn't copy into a new list.
+    # Each node also carries the callables above it, so a type that (indirectly) takes
+    # itself as a parameter is reported rather than expanded forever
+    queue = collections.deque([(root, tuple(prefix), (callable,))])
+    while queue:
+        node, node_prefix, ancestors = queue.popleft()
+        for p in inspect_parameters(node.callable):
+            leaf = annotate_leaf(p, interpreter, node_prefix)
+            if leaf is not None:
+                node.needed_inputs.append(leaf)
+                continue
+            t = unwrap_optional(p.annotation)
+            child_prefix = node_prefix + (p.name,)
+            if t in ancestors:
+                raise ValueError(
+                    f"Recursive parameter {'.'.join(child_prefix)}: {type_to_string(t)}"
+                    " (directly or indirectly) takes itself as a parameter"
+                )
+            child = AnnotatedCallable(t, p.name, [])
+            node.needed_inputs.append(child)
+            queue.append((child, child_prefix, ancestors + (t,)))
+    return root
+
+
+# Annotations are keyed on the callable and the identity of the interpreters dict. The dict
+# itself is kept in the cache entry so its id cannot be reused by another object while
+# the entry is alive. Least recently used entries are dropped past
+# MAX_CACHED_ANNOTATIONS, since each one keeps its interpreters dict alive.
+MAX_CACHED_ANNOTATIONS = 128
+_annotation_cache: Dict[
+    Tuple[Callable, int], Tuple[StringInterpreters, AnnotatedCallable]
+] = {}
+
+
+def cached_annotate_callable(
+    callable: Callable[..., T], interpreter: StringInterpreters
+) -> AnnotatedCallable[T]:
+    """
+    `annotate_callable` for a top level callable, reusing the result of previous calls
+
+    Call `clear_cli_cache` if you modify an interpreters dict after it has been used.
+    """
+    key = (callable, id(interpreter))
+    try:
+        # popped and reinserted below so the dict stays in least recently used order
+        cached = _annotation_cache.pop(key, None)
+    except TypeError:
+        # unhashable callable, nothing we can do but annotate it again
+        return annotate_callable(callable, interpreter, ())
+    if cached is None or cached[0] is not interpreter:
+        cached = (interpreter, annotate_callable(callable, interpreter, ()))
+        if len(_annotation_cache) >= MAX_CACHED_ANNOTATIONS:
+            del _annotation_cache[next(iter(_annotation_cache))]
+    _annotation_cache[key] = cached
+    return cached[1]
+
+
+def clear_cli_cache() -> None:
+    """
+    Forget all cached callable annotations, signatures, and config files
+    """
+    _annotation_cache.clear()
+    cached_inspect_parameters.cache_clear()
+    with _config_file_cache_lock:
+        _config_file_cache.clear()
 
 
 ################################################################################
@@ -434,10 +858,26 @@ def annotate_callable(
 ################################################################################
 
 
-def import_module_by_path(path: pathlib.Path) -> types.ModuleType:
-    spec = importlib.util.spec_from_file_location(target.name, str(target))
+def import_module_by_path(path: Union[str, "os.PathLike[str]"]) -> types.ModuleType:
+    """
+    Import the module at `path`, reusing it if it was already imported this way
+    """
+    import importlib.util
+
+    path = os.path.realpath(path)
+    key = f"_clifun_module_{path}"
+    module = sys.modules.get(key)
+    if module is not None:
+        return module
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
     module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
+    sys.modules[key] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[key]
+        raise
     return module
 
 
@@ -446,7 +886,7 @@ if __name__ == "__main__":
     if len(sys.argv) < 3:
         print("Usage: clifun.py path_to_module function_name ...")
         sys.exit(1)
-    target = pathlib.Path(sys.argv[1]).resolve()
+    target = sys.argv[1]
     function_name = sys.argv[2]
     arguments = sys.argv[2:]
     module = import_module_by_path(target)
@@ -1,7 +1,14 @@
 import datetime as dt
+import gc
+import inspect
+import json
+import os
 import pathlib
 import sys
+import weakref
+from typing import Optional
 
+import attr
 import pytest
 
 import clifun
@@ -63,3 +70,230 @@ def test_config_file():
     value2 = clifun.call(advanced.Bar, args2)
 
     assert value2 == advanced.Bar(advanced.Foo(dt.datetime(2021, 1, 1), "test"), 1)
+
+
+def test_annotation_cache():
+    clifun.clear_cli_cache()
+    try:
+        interpreters = clifun.default_string_interpreters()
+        first = clifun.cached_annotate_callable(function.my_program, interpreters)
+        assert (
+            clifun.cached_annotate_callable(function.my_program, interpreters) is first
+        )
+        assert (
+            clifun.cached_annotate_callable(
+                function.my_program, clifun.default_string_interpreters()
+            )
+            is not first
+        )
+
+        clifun.clear_cli_cache()
+        assert (
+            clifun.cached_annotate_callable(function.my_program, interpreters)
+            is not first
+        )
+
+        for _ in range(clifun.MAX_CACHED_ANNOTATIONS + 10):
+            clifun.cached_annotate_callable(
+                function.my_program, clifun.default_string_interpreters()
+            )
+        assert len(clifun._annotation_cache) == clifun.MAX_CACHED_ANNOTATIONS
+    finally:
+        clifun.clear_cli_cache()
+
+
+def test_caches_release_callables():
+    class Runner:
+        def run(self, a: int):
+            return a
+
+    clifun.clear_cli_cache()
+    try:
+        first = Runner()
+        first_ref = weakref.ref(first)
+        clifun.call(first.run, ["test_release", "--a", "1"])
+        del first
+
+        limit = max(clifun.MAX_CACHED_SIGNATURES, clifun.MAX_CACHED_ANNOTATIONS)
+        for _ in range(limit):
+            clifun.call(Runner().run, ["test_release", "--a", "1"])
+        gc.collect()
+
+        assert first_ref() is None
+    finally:
+        clifun.clear_cli_cache()
+
+
+def test_fast_parameters_match_signature():
+    for t in [basic.Basic, advanced.Foo, advanced.Bar, function.my_program]:
+        expected = tuple(inspect.signature(t).parameters.values())
+        assert clifun.fast_parameters(t) == expected
+
+
+def test_later_config_files_override_earlier(tmp_path):
+    override = tmp_path / "override.json"
+    override.write_text('{"c": "2", "f.b": "override"}')
+    args = ["test_config", str(examples_dir / "foo.json"), str(override)]
+
+    value = clifun.call(advanced.Bar, args)
+
+    assert value == advanced.Bar(advanced.Foo(dt.datetime(2021, 1, 1), "override"), 2)
+
+
+def test_environment(monkeypatch):
+    monkeypatch.setenv("F.A", "2021-01-01")
+    monkeypatch.setenv("C", "2")
+    args = ["test_environment", "--c", "1"]
+
+    value = clifun.call(advanced.Bar, args)
+
+    assert value == advanced.Bar(advanced.Foo(dt.datetime(2021, 1, 1)), 1)
+
+
+def test_import_module_by_path():
+    module = clifun.import_module_by_path(examples_dir / "function.py")
+
+    assert module.my_program(1, "b") == (1, "b")
+    assert clifun.import_module_by_path(examples_dir / "function.py") is module
+
+
+def test_changed_config_file_is_reloaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(clifun, "CONFIG_FILE_CACHE_BYTES", 1000)
+    clifun.clear_cli_cache()
+    config = tmp_path / "config.json"
+    config.write_text('{"c": "1"}')
+    os.utime(config, ns=(10**18, 10**18))
+    assert clifun.load_config_files([str(config)]).get("c") == "1"
+    assert str(config) in clifun._config_file_cache
+
+    # same size, so only the new modification time shows the change
+    config.write_text('{"c": "2"}')
+    os.utime(config, ns=(10**18 + 1, 10**18 + 1))
+    assert clifun.load_config_files([str(config)]).get("c") == "2"
+    clifun.clear_cli_cache()
+
+
+def test_config_file_cache_size(tmp_path, monkeypatch):
+    clifun.clear_cli_cache()
+    config = tmp_path / "config.json"
+    config.write_text('{"c": "1"}')
+
+    # off by default
+    assert clifun.load_config_files([str(config)]).get("c") == "1"
+    assert not clifun._config_file_cache
+
+    # files that don't fit are dropped, least recently used first
+    monkeypatch.setattr(clifun, "CONFIG_FILE_CACHE_BYTES", 25)
+    other = tmp_path / "other.json"
+    other.write_text('{"c": "2"}')
+    assert clifun.load_config_files([str(config)]).get("c") == "1"
+    assert clifun.load_config_files([str(other)]).get("c") == "2"
+    assert list(clifun._config_file_cache) == [str(config), str(other)]
+    assert clifun.load_config_files([str(config)]).get("c") == "1"
+    third = tmp_path / "third.json"
+    third.write_text('{"c": "3"}')
+    assert clifun.load_config_files([str(third)]).get("c") == "3"
+    assert list(clifun._config_file_cache) == [str(config), str(third)]
+    clifun.clear_cli_cache()
+
+
+def test_nested_config_file(tmp_path):
+    config = tmp_path / "nested.json"
+    config.write_text('{"f": {"a": "2021-01-01", "b": "nested"}, "c": "1"}')
+
+    value = clifun.call(advanced.Bar, ["test_nested_config", str(config)])
+
+    assert value == advanced.Bar(advanced.Foo(dt.datetime(2021, 1, 1), "nested"), 1)
+
+
+def test_object_valued_config_leaf(tmp_path):
+    config = tmp_path / "object.json"
+    config.write_text('{"opts": {"a": 1}}')
+    interpreters = clifun.default_string_interpreters()
+    interpreters[dict] = lambda s: s if isinstance(s, dict) else json.loads(s)
+
+    def program(opts: dict):
+        return opts
+
+    value = clifun.call(program, ["test_object_config", str(config)], interpreters)
+
+    assert value == {"a": 1}
+
+
+def test_deeply_nested():
+    @attr.s(auto_attribs=True, frozen=True)
+    class Baz:
+        b: advanced.Bar
+        d: int
+
+    args = ["test_nested", "--b.f.a", "2021-01-01", "--b.c", "1", "--d", "2"]
+
+    value = clifun.call(Baz, args)
+
+    assert value == Baz(advanced.Bar(advanced.Foo(dt.datetime(2021, 1, 1)), 1), 2)
+
+
+def test_missing_config_file():
+    args = ["test_missing_config", "--a", "1", "--b", "x", "nonexistent.json"]
+
+    with pytest.raises(ValueError, match="nonexistent.json"):
+        clifun.call(function.my_program, args)
+
+
+def test_config_file_not_parsed_if_unneeded(tmp_path):
+    config = tmp_path / "invalid.json"
+    config.write_text("not json")
+    args = ["test_unneeded_config", "--a", "1", "--b", "x", str(config)]
+
+    assert clifun.call(function.my_program, args) == (1, "x")
+
+
+def test_recursive_type():
+    class Node:
+        def __init__(self, value: int, child):
+            self.value = value
+            self.child = child
+
+    Node.__init__.__annotations__["child"] = Optional[Node]
+
+    with pytest.raises(ValueError, match="child"):
+        clifun.call(Node, ["test_recursive", "--value", "1"])
+
+
+def test_interpret_date():
+    assert clifun.interpret_date("2021-01-05") == dt.date(2021, 1, 5)
+    assert clifun.interpret_date("2021-1-5") == dt.date(2021, 1, 5)
+
+    for s in ["20210105", "2021-W01-1", "2021-13-01"]:
+        with pytest.raises(clifun.InterpretationError):
+            clifun.interpret_date(s)
+
+
+def test_config_file_must_be_object(tmp_path):
+    config = tmp_path / "list.json"
+    config.write_text("[1, 2]")
+
+    with pytest.raises(ValueError, match="must contain a JSON object"):
+        clifun.call(advanced.Bar, ["test_list_config", str(config)])
+
+
+def test_unhashable_callable():
+    class Program:
+        __hash__ = None
+
+        def __call__(self, a: int, b: str = "not provided"):
+            return (a, b)
+
+    args = ["test_unhashable", "--a", "1"]
+
+    assert clifun.call(Program(), args) == (1, "not provided")
+
+
+def test_introspection_errors_are_not_retried():
+    def program(a: "int"):
+        return a
+
+    with pytest.raises(TypeError) as excinfo:
+        clifun.call(program, ["test_string_annotation", "--a", "1"])
+
+    assert excinfo.value.__context__ is None